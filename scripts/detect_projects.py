@@ -42,10 +42,10 @@ def get_names_from_csv(file_obj: Iterable[str], *, column_name: str) -> set[str]
 
 
 def get_original_packages() -> set[str]:
+    # Parse rows as they arrive instead of holding the whole body in memory:
     with urllib.request.urlopen(TOP_PYPI_PACKAGES_URL) as response:
-        text = response.read().decode("utf-8")
-    file = io.StringIO(text)
-    return get_names_from_csv(file, column_name="project")
+        file = io.TextIOWrapper(response, encoding="utf-8", newline="")
+        return get_names_from_csv(file, column_name="project")
 
 
 def get_local_packages() -> set[str]:
@@ -7,9 +7,9 @@ This script analyzes Python packages from the "top-pypi-packages" dataset
 and determines whether they provide typing information in one of two ways:
 
 1. **Bundled typing**:
-   - The package includes a `py.typed` marker file.
-   - All Python files in the release must be inside directories
-     containing a `py.typed` file.
+   - The package declares the `Typing :: Typed` trove classifier, or
+   - the package includes a `py.typed` marker file, and all Python files
+     in the release are inside directories containing a `py.typed` file.
 
 2. **Stub packages**:
    - A separate `types-<package>` distribution is available on PyPI.
@@ -17,8 +17,10 @@ and determines whether they provide typing information in one of two ways:
 Workflow:
     - Read package names from `top-pypi-packages.csv`.
     - For each package, fetch the latest release metadata from PyPI.
-    - Download the wheel (`.whl`) or source distribution (`.tar.gz` / `.zip`).
-    - Inspect the contents to check for `py.typed`.
+    - Packages with the `Typing :: Typed` classifier need no download.
+    - Otherwise read the wheel's (`.whl`) central directory with HTTP Range requests,
+      or download the source distribution (`.tar.gz` / `.zip`).
+    - Inspect the file listing to check for `py.typed`.
     - If not present, query PyPI for a matching `types-<package>` stub.
     - Append the results to CSV file with the following columns:
         * package
@@ -28,6 +30,7 @@ Workflow:
 Output files:
     - `pypi-packages-typing.csv` – cumulative table with typing information.
     - `checker.log` – detailed logs of execution.
+    - `.cache/` – PyPI metadata and archive listings reused across runs.
 
 Basic usage:
 $ python3 scripts/parse_pypi.py
@@ -37,25 +40,61 @@ from __future__ import annotations
 
 import asyncio
 import csv
-import io
+import itertools
 import logging
+import re
+import struct
 import sys
 import tarfile
+import tempfile
 import urllib.parse
 import zipfile
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass
 from pathlib import Path
-from types import CoroutineType
-from typing import Annotated, Any, Final
+from typing import IO, Annotated, Any, Final
 
 import aiohttp
+import backoff
+import diskcache
+import orjson
 
 BASE_PATH: Final = Path()
 INPUT_FILE: Final = "https://raw.githubusercontent.com/hugovk/top-pypi-packages/main/top-pypi-packages.csv"
 OUTPUT_FILE: Final = BASE_PATH / "pypi-packages-typing.csv"
 LOG_FILE: Final = BASE_PATH / "checker.log"
+CACHE_DIR: Final = BASE_PATH / ".cache"
 PYPI_JSON_URL: Final = "https://pypi.org/pypi/{package}/json"
+# PEP 691 JSON Simple API, expects a normalized project name:
+PYPI_SIMPLE_URL: Final = "https://pypi.org/simple/{package}/"
+PYPI_SIMPLE_HEADERS: Final = {"Accept": "application/vnd.pypi.simple.v1+json"}
+TYPED_CLASSIFIER: Final = "Typing :: Typed"
 HEADERS: Final = {"User-Agent": "pypi-typing-checker (contact: donbarbos@proton.me)"}
+# New stub packages show up on PyPI, so lookups are only reused for a day:
+STUB_CACHE_EXPIRE: Final = 24 * 60 * 60
+# Packages checked at once, also the connection limit per host:
+MAX_CONCURRENT_PACKAGES: Final = 10
+# All requests go to a couple of hosts, so DNS answers can live longer:
+DNS_CACHE_TTL: Final = 5 * 60
+
+# Attempts per HTTP request before transient errors are given up on:
+MAX_HTTP_TRIES: Final = 4
+# sdists are downloaded in chunks into a file kept in memory up to this size:
+DOWNLOAD_CHUNK_SIZE: Final = 64 * 1024
+SPOOL_MAX_SIZE: Final = 2 * 1024 * 1024
+
+# Leading bytes of the sdist archive formats we can read:
+ZIP_MAGIC: Final = b"PK\x03\x04"
+GZIP_MAGIC: Final = b"\x1f\x8b"
+# The end of central directory record sits at the very end of a ZIP archive,
+# optionally followed by a comment of up to 64 KiB:
+ZIP_TAIL_SIZE: Final = 64 * 1024
+ZIP_EOCD_SIGNATURE: Final = b"PK\x05\x06"
+ZIP_EOCD_STRUCT: Final = struct.Struct("<IHHHHIIH")
+ZIP_CD_ENTRY_SIGNATURE: Final = 0x02014B50
+ZIP_CD_ENTRY_STRUCT: Final = struct.Struct("<IHHHHHHIIIHHHHHII")
+ZIP64_MARKER: Final = 0xFFFFFFFF
+ZIP_UTF8_FLAG: Final = 0x800
 
 logging.basicConfig(
     level=logging.INFO,
@@ -66,6 +105,48 @@ logging.basicConfig(
     ],
 )
 
+# Keys are URLs: the release picked from PyPI JSON is stored with its ETag
+# for revalidation, file listings by archive URL since uploads are immutable,
+# stub package lookups with an expiry.
+cache = diskcache.Cache(CACHE_DIR)
+
+
+# The cache is SQLite and files on disk, keep that I/O off the event loop:
+async def cache_get(key: str) -> Any:
+    return await asyncio.to_thread(cache.get, key)
+
+
+async def cache_set(key: str, value: Any, *, expire: float | None = None) -> None:
+    await asyncio.to_thread(cache.set, key, value, expire=expire)
+
+
+type ResultRow = tuple[str, bool, bool | None]
+
+
+def is_transient_http_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def is_permanent_http_error(e: Exception) -> bool:
+    if not isinstance(e, aiohttp.ClientResponseError):
+        return False
+    return not is_transient_http_status(e.status)
+
+
+def retry_on_transient_errors[F: Callable[..., Any]]() -> Callable[[F], F]:
+    """Retry connection resets, timeouts, 429 and 5xx responses."""
+    # A new decorator for each function: backoff appends its log handlers
+    # every time one decorator object is applied, duplicating log lines.
+    return backoff.on_exception(
+        backoff.expo,
+        (aiohttp.ClientError, asyncio.TimeoutError),
+        max_tries=MAX_HTTP_TRIES,
+        jitter=backoff.full_jitter,
+        giveup=is_permanent_http_error,
+        # `process_package` already logs the final error with its traceback:
+        giveup_log_level=logging.DEBUG,
+    )
+
 
 @dataclass
 class PypiReleaseDownload:
@@ -73,156 +154,372 @@ class PypiReleaseDownload:
     url: str
     packagetype: Annotated[str, "Should hopefully be either 'bdist_wheel' or 'sdist'"]
     filename: str
+    classifiers: list[str]
+
+
+def path_name(path: str) -> str:
+    """Same as `PurePosixPath(path).name` without building a path object."""
+    return path[path.rfind("/") + 1 :]
+
+
+def path_suffix(name: str) -> str:
+    """Same as `PurePosixPath(name).suffix` for a bare file name."""
+    dot = name.rfind(".")
+    if 0 < dot < len(name) - 1:
+        return name[dot:]
+    return ""
+
+
+def is_in_py_typed_dir(dir_prefix: str, py_typed_dirs: set[str]) -> bool:
+    while dir_prefix:
+        if dir_prefix in py_typed_dirs:
+            return True
+        dir_prefix = dir_prefix[: dir_prefix.rfind("/", 0, -1) + 1]
+    return "" in py_typed_dirs
 
 
 def all_py_files_in_source_are_in_py_typed_dirs(
-    source: zipfile.ZipFile | tarfile.TarFile,
+    files: Iterable[tuple[str, int]],
 ) -> bool:
-    py_typed_dirs: list[Path] = []
-    all_python_files: list[Path] = []
+    """Check `(path, size)` pairs of regular files listed in an archive."""
+    # Directories are kept as path prefixes with a trailing slash ("" is the
+    # archive root), so containment is a set lookup per parent directory:
+    py_typed_dirs: set[str] = set()
+    python_file_dirs: set[str] = set()
     py_file_suffixes = {".py", ".pyi"}
 
-    if isinstance(source, zipfile.ZipFile):
-        path_iter = (
-            Path(zip_info.filename)
-            for zip_info in source.infolist()
-            if (
-                (not zip_info.is_dir())
-                and not (
-                    Path(zip_info.filename).name == "__init__.py"
-                    and zip_info.file_size == 0
-                )
-            )
-        )
-    else:
-        path_iter = (
-            Path(tar_info.path)
-            for tar_info in source
-            if (
-                tar_info.isfile()
-                and not (
-                    Path(tar_info.name).name == "__init__.py" and tar_info.size == 0
-                )
-            )
-        )
-
-    for path in path_iter:
-        if path.suffix in py_file_suffixes:
-            all_python_files.append(path)
-        elif path.name == "py.typed":
-            py_typed_dirs.append(path.parent)
+    for filename, size in files:
+        name = path_name(filename)
+        if name == "__init__.py" and size == 0:
+            continue
+        if path_suffix(name) in py_file_suffixes:
+            python_file_dirs.add(filename[: len(filename) - len(name)])
+        elif name == "py.typed":
+            py_typed_dirs.add(filename[: len(filename) - len(name)])
 
     if not py_typed_dirs:
         return False
-    if not all_python_files:
+    if not python_file_dirs:
         return False
 
-    for path in all_python_files:
-        if not any(py_typed_dir in path.parents for py_typed_dir in py_typed_dirs):
-            return False
-    return True
+    # Stops at the first directory of Python files not covered by `py.typed`:
+    return all(
+        is_in_py_typed_dir(dir_prefix, py_typed_dirs) for dir_prefix in python_file_dirs
+    )
 
 
+def iter_zip_central_directory(
+    central_directory: bytes,
+) -> Iterator[tuple[str, int]]:
+    """Yield `(path, uncompressed size)` of each file in a raw ZIP central directory."""
+    offset = 0
+    while offset < len(central_directory):
+        (
+            signature,
+            _version_made_by,
+            _version_needed,
+            flags,
+            _compression,
+            _mod_time,
+            _mod_date,
+            _crc32,
+            _compressed_size,
+            file_size,
+            name_length,
+            extra_length,
+            comment_length,
+            *_,
+        ) = ZIP_CD_ENTRY_STRUCT.unpack_from(central_directory, offset)
+        if signature != ZIP_CD_ENTRY_SIGNATURE:
+            raise ValueError(f"Bad central directory entry at offset {offset}")
+        name_start = offset + ZIP_CD_ENTRY_STRUCT.size
+        raw_name = central_directory[name_start : name_start + name_length]
+        filename = raw_name.decode("utf-8" if flags & ZIP_UTF8_FLAG else "cp437")
+        offset = name_start + name_length + extra_length + comment_length
+        if not filename.endswith("/"):
+            yield filename, file_size
+
+
+# Only file names and sizes are ever needed. Archive helpers below read
+# listings only: never call `read`, `open` or `extractfile` on an archive,
+# that would decompress file payloads for nothing.
+
+
+def iter_zip_files(zf: zipfile.ZipFile) -> Iterator[tuple[str, int]]:
+    """Yield `(path, size)` of each regular file from the ZIP central directory."""
+    # `ZipFile` parses the central directory when opened, `infolist` just
+    # returns it without touching the compressed data:
+    for zip_info in zf.infolist():
+        if not zip_info.is_dir():
+            yield zip_info.filename, zip_info.file_size
+
+
+def iter_tar_files(tf: tarfile.TarFile) -> Iterator[tuple[str, int]]:
+    """Yield `(path, size)` of each regular file from the tar member headers."""
+    # The size is part of the header, so file payloads are skipped over
+    # and `extractfile` is never needed:
+    while (tar_info := tf.next()) is not None:
+        if tar_info.isfile():
+            yield tar_info.name, tar_info.size
+
+
+@retry_on_transient_errors()
+async def fetch_byte_range(
+    url: str, start: int, end: int, *, session: aiohttp.ClientSession
+) -> bytes:
+    async with session.get(url, headers={"Range": f"bytes={start}-{end}"}) as response:
+        response.raise_for_status()
+        if response.status != 206:
+            raise ValueError(f"Server ignored the Range request for {url}")
+        return await response.read()
+
+
+@retry_on_transient_errors()
+async def fetch_file_tail(
+    url: str, length: int, *, session: aiohttp.ClientSession
+) -> tuple[bytes, int]:
+    """Return the last `length` bytes of a remote file and the file size."""
+    # A suffix range needs no prior HEAD request for the size:
+    async with session.get(url, headers={"Range": f"bytes=-{length}"}) as response:
+        response.raise_for_status()
+        tail = await response.read()
+        if response.status == 200:
+            # The whole file was sent, it is shorter than `length`:
+            return tail, len(tail)
+        # Content-Range: bytes <first>-<last>/<size>
+        size = response.headers.get("Content-Range", "").rpartition("/")[2]
+        if not size.isdigit():
+            raise ValueError(f"Unknown size in Range response for {url}")
+        return tail, int(size)
+
+
+async def fetch_zip_central_directory(
+    url: str, session: aiohttp.ClientSession
+) -> bytes:
+    """Download only the central directory of a remote ZIP archive."""
+    # For most wheels the central directory fits in the tail as well, so
+    # this is the only request:
+    tail, size = await fetch_file_tail(url, ZIP_TAIL_SIZE, session=session)
+    tail_start = size - len(tail)
+    eocd_offset = tail.rfind(ZIP_EOCD_SIGNATURE)
+    if eocd_offset == -1:
+        raise ValueError(f"End of central directory record not found in {url}")
+    *_, cd_size, cd_offset, _comment_length = ZIP_EOCD_STRUCT.unpack_from(
+        tail, eocd_offset
+    )
+    if ZIP64_MARKER in (cd_size, cd_offset):
+        raise ValueError(f"ZIP64 archives are not supported: {url}")
+
+    if cd_size == 0:
+        return b""
+    if cd_offset >= tail_start:
+        return tail[cd_offset - tail_start : cd_offset - tail_start + cd_size]
+    return await fetch_byte_range(
+        url, cd_offset, cd_offset + cd_size - 1, session=session
+    )
+
+
+def pick_release_file(files: list[dict[str, Any]]) -> dict[str, Any]:
+    """Prefer a pure-Python wheel, then any wheel, then the last file (sdist)."""
+    wheel = None
+    for file_info in files:
+        if file_info["packagetype"] == "bdist_wheel":
+            # Usually much smaller than the platform-specific wheels:
+            if file_info["filename"].endswith("-none-any.whl"):
+                return file_info
+            if wheel is None:
+                wheel = file_info
+    return wheel or files[-1]
+
+
+@retry_on_transient_errors()
 async def fetch_latest_pypi_release(
     package: str, session: aiohttp.ClientSession
 ) -> PypiReleaseDownload:
-    async with session.get(
-        PYPI_JSON_URL.format(package=urllib.parse.quote(package))
-    ) as response:
-        response.raise_for_status()
-        j = await response.json()
-        releases = j["releases"]
-        version = j["info"]["version"]
-        release_info = sorted(
-            releases[version],
-            key=lambda x: bool(x["packagetype"] == "bdist_wheel"),
-        )[-1]
-        return PypiReleaseDownload(
-            distribution=package,
-            url=release_info["url"],
-            packagetype=release_info["packagetype"],
-            filename=release_info["filename"],
+    url = PYPI_JSON_URL.format(package=urllib.parse.quote(package))
+    # Only builtins are cached, so entries don't depend on how (or under
+    # which module name) `PypiReleaseDownload` is defined:
+    cached: tuple[str, str, str, str, list[str]] | None = await cache_get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    async with session.get(url, headers=headers) as response:
+        if cached and response.status == 304:
+            _etag, file_url, packagetype, filename, classifiers = cached
+        else:
+            response.raise_for_status()
+            j = orjson.loads(await response.read())
+            releases = j["releases"]
+            version = j["info"]["version"]
+            release_info = pick_release_file(releases[version])
+            file_url = release_info["url"]
+            packagetype = release_info["packagetype"]
+            filename = release_info["filename"]
+            classifiers = j["info"]["classifiers"]
+            # Only what we use is cached, not the whole (often multi-MB) body:
+            if etag := response.headers.get("ETag"):
+                await cache_set(
+                    url, (etag, file_url, packagetype, filename, classifiers)
+                )
+
+    return PypiReleaseDownload(
+        distribution=package,
+        url=file_url,
+        packagetype=packagetype,
+        filename=filename,
+        classifiers=classifiers,
+    )
+
+
+def list_archive_files(body: IO[bytes], filename: str) -> list[tuple[str, int]]:
+    """Return `(path, size)` of each regular file in a downloaded sdist."""
+    magic = body.read(len(ZIP_MAGIC))
+    body.seek(0)
+
+    # sdist defaults to `.tar.gz` on Linux and to `.zip` on Windows:
+    # https://docs.python.org/3.11/distutils/sourcedist.html
+    # The archive format is taken from its leading bytes, not the file name:
+    if magic.startswith(GZIP_MAGIC):
+        # Streaming mode decompresses strictly forward and never seeks back:
+        with tarfile.open(fileobj=body, mode="r|gz") as tf:
+            return list(iter_tar_files(tf))
+    elif magic == ZIP_MAGIC:
+        with zipfile.ZipFile(body) as zf:
+            return list(iter_zip_files(zf))
+    else:
+        raise AssertionError(
+            f"Package file {filename!r} is neither a gzip nor a ZIP archive"
         )
 
 
-async def release_contains_py_typed(
-    release_to_download: PypiReleaseDownload, *, session: aiohttp.ClientSession
-) -> bool:
+@retry_on_transient_errors()
+async def download_to_file(
+    url: str, body: IO[bytes], *, session: aiohttp.ClientSession
+) -> None:
+    """Write the response body to `body` and rewind it."""
+    # Start over if a previous attempt failed halfway:
+    body.seek(0)
+    body.truncate()
     timeout = aiohttp.ClientTimeout(total=10 * 60)
-    async with session.get(release_to_download.url, timeout=timeout) as response:
-        body = io.BytesIO(await response.read())
+    async with session.get(url, timeout=timeout) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            body.write(chunk)
+    body.seek(0)
+
 
+async def list_release_files(
+    release_to_download: PypiReleaseDownload, *, session: aiohttp.ClientSession
+) -> list[tuple[str, int]]:
+    """Return `(path, size)` of each regular file in a release archive."""
     packagetype = release_to_download.packagetype
     if packagetype == "bdist_wheel":
-        assert release_to_download.filename.endswith(".whl")
-        with zipfile.ZipFile(body) as zf:
-            return all_py_files_in_source_are_in_py_typed_dirs(zf)
-    elif packagetype == "sdist":
-        # sdist defaults to `.tar.gz` on Linux and to `.zip` on Windows:
-        # https://docs.python.org/3.11/distutils/sourcedist.html
-        if release_to_download.filename.endswith(".tar.gz"):
-            with tarfile.open(fileobj=body, mode="r:gz") as zf:
-                return all_py_files_in_source_are_in_py_typed_dirs(zf)
-        elif release_to_download.filename.endswith(".zip"):
-            with zipfile.ZipFile(body) as zf:
-                return all_py_files_in_source_are_in_py_typed_dirs(zf)
-        else:
-            raise AssertionError(
-                f"Package file {release_to_download.filename!r} does not end with '.tar.gz' or '.zip'"
-            )
-    else:
+        # Wheels are ZIP archives, the file listing lives in the central
+        # directory at the end, so we never download the file payloads:
+        central_directory = await fetch_zip_central_directory(
+            release_to_download.url, session
+        )
+        return list(iter_zip_central_directory(central_directory))
+    elif packagetype != "sdist":
         raise AssertionError(
             f"Unknown package type for {release_to_download.distribution}: {packagetype!r}"
         )
 
+    # Small sdists stay in memory, big ones spill over to disk:
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as body:
+        await download_to_file(release_to_download.url, body, session=session)
+        # Decompression is CPU-bound, keep it off the event loop:
+        return await asyncio.to_thread(
+            list_archive_files, body, release_to_download.filename
+        )
+
+
+async def release_contains_py_typed(
+    release_to_download: PypiReleaseDownload, *, session: aiohttp.ClientSession
+) -> bool:
+    files: list[tuple[str, int]] | None = await cache_get(release_to_download.url)
+    if files is None:
+        files = await list_release_files(release_to_download, session=session)
+        await cache_set(release_to_download.url, files)
+    return all_py_files_in_source_are_in_py_typed_dirs(files)
+
 
 async def is_typed_package(package: str, *, session: aiohttp.ClientSession) -> bool:
     latest_release = await fetch_latest_pypi_release(package, session)
+    # Trust the classifier from the metadata we already have over downloading:
+    if TYPED_CLASSIFIER in latest_release.classifiers:
+        return True
     return await release_contains_py_typed(latest_release, session=session)
 
 
+@retry_on_transient_errors()
+async def fetch_simple_index_status(url: str, *, session: aiohttp.ClientSession) -> int:
+    # Only the status matters, so skip the body:
+    async with session.head(
+        url, headers=PYPI_SIMPLE_HEADERS, allow_redirects=False
+    ) as response:
+        if is_transient_http_status(response.status):
+            response.raise_for_status()
+        return response.status
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a project name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
 async def has_types_stub_package(
     package: str, *, session: aiohttp.ClientSession
 ) -> bool | None:
-    stub_package = f"types-{package}"
-    url = PYPI_JSON_URL.format(package=urllib.parse.quote(stub_package))
+    stub_package = f"types-{normalize_name(package)}"
+    url = PYPI_SIMPLE_URL.format(package=urllib.parse.quote(stub_package))
+    cached: bool | None = await cache_get(url)
+    if cached is not None:
+        return cached
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                return True
-            elif response.status == 404:
-                return False
-            else:
-                logging.warning(
-                    f"Unexpected status {response.status} when checking {stub_package}"
-                )
-                return None
+        status = await fetch_simple_index_status(url, session=session)
+        if status == 200:
+            await cache_set(url, True, expire=STUB_CACHE_EXPIRE)
+            return True
+        elif status == 404:
+            await cache_set(url, False, expire=STUB_CACHE_EXPIRE)
+            return False
+        else:
+            logging.warning(f"Unexpected status {status} when checking {stub_package}")
+            return None
     except Exception as e:
         logging.warning(f"Error checking types stub for {package}: {e}")
         return None
 
 
-def append_result_to_csv(
-    package: str, *, has_py_typed: bool, has_types_package: bool | None
-) -> None:
+async def write_results_to_csv(results: asyncio.Queue[ResultRow]) -> None:
+    """Append rows from `results` to the output file until the queue is shut down."""
     file_exists = Path.is_file(OUTPUT_FILE)
     with Path.open(OUTPUT_FILE, "a", newline="", encoding="utf-8") as f:
         writer = csv.writer(f, lineterminator="\n")
         if not file_exists:
             writer.writerow(["package", "has_py_typed", "has_types_package"])
-        writer.writerow([package, has_py_typed, has_types_package])
+
+        def write_row(row: ResultRow) -> None:
+            writer.writerow(row)
+            f.flush()
+
+        while True:
+            try:
+                row = await results.get()
+            except asyncio.QueueShutDown:
+                return
+            # Flush every row so an interrupted run keeps its results, and do
+            # the disk I/O in a thread to keep the event loop free:
+            await asyncio.to_thread(write_row, row)
 
 
 def read_names_from_reader(
-    reader: csv.DictReader, *, max_count: int | None = None
+    reader: Iterator[list[str]], *, max_count: int | None = None
 ) -> list[str]:
-    packages: list[str] = []
-    for num, row in enumerate(reader):
-        if max_count is None or num < max_count:
-            packages.append(row["project"])
-        else:
-            break
-    return packages
+    header = next(reader, None)
+    if header is None:
+        return []
+    column = header.index("project")
+    return [row[column] for row in itertools.islice(reader, max_count) if row]
 
 
 async def get_package_names(
@@ -233,7 +530,7 @@ async def get_package_names(
     if isinstance(source, Path) and Path(source).exists():
         # Old implementation for Path source:
         with Path.open(source, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
+            reader = csv.reader(csvfile)
             packages = read_names_from_reader(reader, max_count=max_count)
     else:
         # Expecting URL string:
@@ -243,7 +540,7 @@ async def get_package_names(
                 text = await resp.text()
 
         # Parse CSV from string:
-        reader = csv.DictReader(text.splitlines())
+        reader = csv.reader(text.splitlines())
         packages = read_names_from_reader(reader, max_count=max_count)
 
     return packages
@@ -252,29 +549,32 @@ async def get_package_names(
 def load_processed_packages() -> set[str]:
     if not Path.is_file(OUTPUT_FILE):
         return set()
-    processed = set()
     with Path.open(OUTPUT_FILE, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            processed.add(row["package"])
-    return processed
+        reader = csv.reader(f)
+        next(reader, None)  # header, `package` is the first column
+        return {row[0] for row in reader if row}
 
 
 async def process_package(
-    pkg: str, i: int, total: int, *, session: aiohttp.ClientSession
+    pkg: str,
+    i: int,
+    total: int,
+    *,
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    results: asyncio.Queue[ResultRow],
 ) -> None:
     has_types_package = None
-    try:
-        # TODO: Implement delay to avoid going over the PyPI rate limit:
-        has_py_typed = await is_typed_package(pkg, session=session)
-        if not has_py_typed:
-            has_types_package = await has_types_stub_package(pkg, session=session)
-    except Exception:
-        logging.exception(f"[{i}/{total}] Error processing {pkg}")
-        return
-    append_result_to_csv(
-        pkg, has_py_typed=has_py_typed, has_types_package=has_types_package
-    )
+    async with semaphore:
+        try:
+            # TODO: Implement delay to avoid going over the PyPI rate limit:
+            has_py_typed = await is_typed_package(pkg, session=session)
+            if not has_py_typed:
+                has_types_package = await has_types_stub_package(pkg, session=session)
+        except Exception:
+            logging.exception(f"[{i}/{total}] Error processing {pkg}")
+            return
+    await results.put((pkg, has_py_typed, has_types_package))
     logging.info(
         f"[{i}/{total}] Result for {pkg}: {has_py_typed=} {has_types_package=}"
     )
@@ -286,17 +586,49 @@ async def main() -> None:
     total = len(packages)
     skipped = 0
 
-    conn = aiohttp.TCPConnector(limit_per_host=10)
-    async with aiohttp.ClientSession(connector=conn, headers=HEADERS) as session:
-        tasks: list[CoroutineType[Any, Any, None]] = []
-        for i, pkg in enumerate(packages, start=1):
-            if pkg in processed:
-                logging.info(f"[{i}/{total}] Skipping {pkg} (already processed)")
-                skipped += 1
-                continue
-            tasks.append(process_package(pkg, i, total, session=session))
-
-        await asyncio.gather(*tasks)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PACKAGES)
+    results: asyncio.Queue[ResultRow] = asyncio.Queue()
+    writer_task = asyncio.create_task(write_results_to_csv(results))
+
+    try:
+        conn = aiohttp.TCPConnector(
+            limit_per_host=MAX_CONCURRENT_PACKAGES,
+            # Non-blocking lookups via aiodns instead of `getaddrinfo` in a thread:
+            resolver=aiohttp.AsyncResolver(),
+            ttl_dns_cache=DNS_CACHE_TTL,
+        )
+        async with aiohttp.ClientSession(connector=conn, headers=HEADERS) as session:
+            tasks: list[asyncio.Task[None]] = []
+            try:
+                for i, pkg in enumerate(packages, start=1):
+                    if pkg in processed:
+                        logging.info(
+                            f"[{i}/{total}] Skipping {pkg} (already processed)"
+                        )
+                        skipped += 1
+                        continue
+                    coro = process_package(
+                        pkg,
+                        i,
+                        total,
+                        session=session,
+                        semaphore=semaphore,
+                        results=results,
+                    )
+                    tasks.append(asyncio.create_task(coro))
+
+                for task in asyncio.as_completed(tasks):
+                    await task
+            finally:
+                # On Ctrl-C or cancellation, stop the unfinished packages
+                # while the session is still open:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        # Rows of finished packages may still be queued, write them all:
+        results.shutdown()
+        await writer_task
 
     logging.info(f"=== Finished: processed {total - skipped}, skipped {skipped} ===")
 